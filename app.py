@@ -1,19 +1,35 @@
-from fastapi import FastAPI, HTTPException, Request,status
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request,status
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, StringConstraints, ValidationError
+from typing import Annotated, Optional, List
 import re
 import os
+import hmac
+import hashlib
+import time
 import httpx
 from dotenv import load_dotenv
 from generator import GenerateCodeLLM
 from github_manager import GitHubManager
 import asyncio
 from contextlib import asynccontextmanager
+from functools import lru_cache
+from tenacity import (
+    retry,
+    retry_if_exception,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
 
 
 load_dotenv()  # Load environment variables from .env file
 
+# Anything outside [a-z0-9] collapses to a single dash in repository names
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
 
 
 
@@ -22,48 +38,128 @@ class Attachment(BaseModel):
     url: str
 
 
+# Surrounding whitespace is stripped only from `brief` and `evaluation_url`; values echoed
+# back to the evaluator (`task`, `nonce`) and `secret` are kept verbatim
+StrippedStr = Annotated[str, StringConstraints(strip_whitespace=True)]
+
+
 class TaskRequest(BaseModel):
     email: EmailStr
-    secret: str
+    secret: Optional[str] = None # required unless sent in the X-TDS-Secret header
     task: str
     round: int = Field(..., ge=0)
     nonce: str
-    brief: Optional[str] = None
+    brief: Optional[StrippedStr] = None
     checks: Optional[List[str]] = []
-    evaluation_url: Optional[str] = None
+    evaluation_url: Optional[StrippedStr] = None
     attachments: Optional[List[Attachment]] = []
 
 
+# JSON schema of the task body for OpenAPI; nested models are registered as components
+_TASK_REQUEST_SCHEMA = TaskRequest.model_json_schema(ref_template="#/components/schemas/{model}")
+_TASK_REQUEST_COMPONENTS = {
+    **_TASK_REQUEST_SCHEMA.pop("$defs", {}),
+    "TaskRequest": _TASK_REQUEST_SCHEMA,
+}
+
+
+class TaskAccepted(BaseModel):
+    status: str
+    nonce: str
+
+
+
+@lru_cache(maxsize=1)
+def get_llm() -> GenerateCodeLLM:
+    """Returns the shared LLM client (will load the AI_PIPE_TOKEN)."""
+    return GenerateCodeLLM()
+
+
+@lru_cache(maxsize=1)
+def get_github() -> GitHubManager:
+    """Returns the shared GitHub manager (will load the GITHUB_TOKEN)."""
+    return GitHubManager()
+
+
+def require_llm() -> GenerateCodeLLM:
+    """Request-time wrapper for `get_llm`; a failed initialization is not cached and maps to 503."""
+    try:
+        return get_llm()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail="LLM not initialized on server") from e
+
+
+def require_github() -> GitHubManager:
+    """Request-time wrapper for `get_github`; a failed initialization is not cached and maps to 503."""
+    try:
+        return get_github()
+    except ValueError as e:
+        raise HTTPException(status_code=503, detail="GitHub Manager not initialized on server") from e
 
-llm_generator: Optional[GenerateCodeLLM] = None
-github_manager: Optional[GitHubManager] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initializes external resources (LLM and GitHub clients) on startup."""
-    global llm_generator, github_manager
-    
-    # Initialize the LLM (will load the GEMINI_API_KEY)
+    # Initialize the LLM (will load the AI_PIPE_TOKEN)
     try:
-        llm_generator = GenerateCodeLLM()
+        get_llm()
     except ValueError as e:
         print(f"FATAL: LLM initialization failed - {e}")
         # We allow the app to start, but the endpoint will fail
 
     # Initialize the GitHub Manager (will load the GITHUB_TOKEN)
     try:
-        github_manager = GitHubManager()
+        get_github()
     except ValueError as e:
         print(f"FATAL: GitHub initialization failed - {e}")
         # We allow the app to start, but the endpoint will fail
 
+    # Parse the accepted secrets once; allow a comma-separated list
+    allowed = os.environ.get("TDS_ACCEPTED_SECRETS") or os.environ.get("TDS_SECRET") or ""
+    app.state.allowed_secrets = frozenset(s.strip() for s in allowed.split(",") if s.strip())
+
+    # Caps how many tasks run LLM + GitHub work at once, to stay under GitHub's rate limits.
+    # Created here so it belongs to the event loop that serves the app.
+    app.state.github_semaphore = asyncio.Semaphore(int(os.getenv("TDS_MAX_CONCURRENCY", "8")))
+
+    # Shared HTTP client so callbacks and GitHub Pages calls reuse pooled keep-alive
+    # connections instead of paying a fresh TCP+TLS handshake on every task.
+    # HTTP/2 multiplexes concurrent requests to the same host over one connection.
+    app.state.http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=httpx.Timeout(600.0), # Timeout is 10 min (600s)
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=20,
+            keepalive_expiry=300,
+        ),
+    )
+
     print("FastAPI application startup complete. Modules initialized.")
     yield
+    await app.state.http_client.aclose()
     print("FastAPI application shutdown.")
 
 
 
-app = FastAPI(title="TDS Project API", version="0.1.0",lifespan=lifespan)
+app = FastAPI(
+    title="TDS Project API",
+    version="0.1.0",
+    lifespan=lifespan,
+)
+
+_default_openapi = app.openapi
+
+
+def _openapi_with_task_schemas():
+    """Adds the manually parsed TaskRequest body schemas to the generated OpenAPI document."""
+    if app.openapi_schema is None:
+        schema = _default_openapi()
+        schema.setdefault("components", {}).setdefault("schemas", {}).update(_TASK_REQUEST_COMPONENTS)
+    return app.openapi_schema
+
+
+app.openapi = _openapi_with_task_schemas
 
 # NOTE: for development we allow all origins and headers so OPTIONS preflight requests
 # succeed. In production, restrict `allow_origins` to trusted domains or configure
@@ -87,65 +183,90 @@ async def root():
         }
 
 
-@app.post("/tasks", summary="Receive a task submission")
-async def receive_task(payload: TaskRequest, request: Request):
-    """Receive the task submission JSON described in the project brief.
+def _secret_is_allowed(secret: str, allowed_secrets: frozenset) -> bool:
+    """Constant-time check of `secret` against the configured secrets."""
+    secret_bytes = secret.encode("utf-8")
+    return any(hmac.compare_digest(secret_bytes, s.encode("utf-8")) for s in allowed_secrets)
 
-    Validates structure and returns an enriched acknowledgement including the nonce.
-    """
-    # Secret verification: read allowed secrets from environment.
 
+CALLBACK_MAX_ATTEMPTS = 6
+CALLBACK_MAX_WAIT = 32  # seconds
 
+_callback_backoff = wait_exponential_jitter(initial=1, max=CALLBACK_MAX_WAIT)
 
-    allowed = os.environ.get("TDS_ACCEPTED_SECRETS") or os.environ.get("TDS_SECRET")
-    allowed_secrets = []
-    if allowed:
-        # allow comma-separated list
-        allowed_secrets = [s.strip() for s in allowed.split(",") if s.strip()]
 
-    if not allowed_secrets:
-        # If no secret configured, reject to avoid accidental acceptance in production.
-        raise HTTPException(status_code=401, detail="No server-side secret configured")
+def _is_retryable_status(exc: BaseException) -> bool:
+    """Only server errors and rate limiting can succeed on a later attempt."""
+    return isinstance(exc, httpx.HTTPStatusError) and (
+        exc.response.status_code >= 500 or exc.response.status_code == 429
+    )
 
-    if payload.secret not in allowed_secrets:
-        raise HTTPException(status_code=401, detail="Invalid secret")
-    
-    
-    # Acknowledge receipt with enriched data.
-    
-    global llm_generator, github_manager
-    
-    if llm_generator is None:
-        raise HTTPException(status_code=503, detail="LLM not initialized on server")
 
-    if github_manager is None:
-        raise HTTPException(status_code=503, detail="GitHub Manager not initialized on server")
+def _callback_wait(retry_state) -> float:
+    """Honours a numeric Retry-After header, else uses jittered exponential backoff."""
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, httpx.HTTPStatusError):
+        retry_after = exc.response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), CALLBACK_MAX_WAIT)
+    return _callback_backoff(retry_state)
 
 
+@retry(
+    stop=stop_after_attempt(CALLBACK_MAX_ATTEMPTS),
+    wait=_callback_wait,
+    retry=retry_if_exception_type(httpx.RequestError) | retry_if_exception(_is_retryable_status),
+    reraise=True,
+)
+async def _post_callback(client: httpx.AsyncClient, url: str, json: dict) -> httpx.Response:
+    """POSTs the evaluation callback, retrying transient failures."""
+    response = await client.post(url, json=json, headers={"Content-Type": "application/json"})
+    print(response.status_code)
+    response.raise_for_status()
+    return response
+
+
+async def process_task(
+    payload: TaskRequest,
+    client: httpx.AsyncClient,
+    llm_generator: GenerateCodeLLM,
+    github_manager: GitHubManager,
+    github_semaphore: asyncio.Semaphore,
+):
+    """Runs the LLM -> GitHub -> evaluation callback pipeline for one task.
+
+    Scheduled as a background task by `receive_task`, so it never holds the
+    HTTP request open; failures are logged rather than returned.
+    """
     try:
         print(f"Processing request for task: {payload.task}, round: {payload.round}")
-        import time
-
-        
-        start = time.time()
+        start = time.perf_counter()
         
         task_data_dict = payload.model_dump()
-        generated_files = llm_generator.generate_app_files(task_data_dict)
-        
-        
-        if not generated_files:
-            raise ValueError("LLM failed to generate any files.")
-        
-        task_slug = payload.task.lower().replace(" ", "-")
+        task_slug = _SLUG_RE.sub("-", payload.task.lower()).strip("-")
+        if not task_slug:
+            # e.g. non-Latin task names; keep distinct tasks in distinct repositories
+            task_slug = "task-" + hashlib.sha256(payload.task.encode("utf-8")).hexdigest()[:12]
         task_id = f"{task_slug}-round-{payload.round}"
 
-        print(f"Generated files for task ID: {task_id}: {list(generated_files.keys())}")
-        
-        
-        repo_url, commit_sha, pages_url = github_manager.create_and_deploy(
-            task_id=task_id,
-            files=generated_files
-        )
+        async with github_semaphore:
+            # LLM generation and repository creation are independent, so overlap them
+            generated_files, repo = await asyncio.gather(
+                asyncio.to_thread(llm_generator.generate_app_files, task_data_dict),
+                github_manager.ensure_repo(task_id),
+            )
+
+            if not generated_files:
+                raise ValueError("LLM failed to generate any files.")
+
+            print(f"Generated files for task ID: {task_id}: {list(generated_files.keys())}")
+
+            repo_url, commit_sha, pages_url = await github_manager.create_and_deploy(
+                task_id=task_id,
+                files=generated_files,
+                http_client=client,
+                repo=repo
+            )
         # We use the repo_url or pages_url as the final output URL for the user
         final_url = pages_url if pages_url else repo_url
         
@@ -161,44 +282,7 @@ async def receive_task(payload: TaskRequest, request: Request):
                 "pages_url": pages_url,
             }
             
-            async with httpx.AsyncClient(timeout=600.0) as client: # Timeout is 10 min (600s)
-                response = await client.post(
-                    payload.evaluation_url,
-                    json=callback_json,
-                    headers={"Content-Type": "application/json"}
-                )
-                max_attempts = 6  # retries: 1,2,4,8,16,32 seconds
-                delay = 1
-                last_exc = None
-
-                for attempt in range(1, max_attempts + 1):
-                    print(response.status_code)
-                    try:
-                        response = await client.post(
-                            payload.evaluation_url,
-                            json=callback_json,
-                            headers={"Content-Type": "application/json"}
-                        )
-                        
-                        if response.status_code == 200:
-                            response.raise_for_status()
-                            break
-                        # non-200 status -> prepare an HTTPStatusError and retry
-                        last_exc = httpx.HTTPStatusError(
-                            f"Unexpected status {response.status_code}",
-                            request=response.request,
-                            response=response,
-                        )
-                    except httpx.RequestError as e:
-                        last_exc = e
-
-                    if attempt == max_attempts:
-                        # Exhausted retries, re-raise last exception to be handled by outer except
-                        raise last_exc
-
-                    await asyncio.sleep(delay)
-                    delay *= 2
-            
+            await _post_callback(client, payload.evaluation_url, callback_json)
             print(f"Successfully posted results to evaluation URL: {payload.evaluation_url}")
             
            
@@ -209,23 +293,90 @@ async def receive_task(payload: TaskRequest, request: Request):
         except httpx.HTTPStatusError as e:
             print(f"WARNING: Failed to post to evaluation URL. Server returned status: {e.response.status_code}")
         
-        # 4.5. Success Response
-        end = time.time()
+        # 4.5. Success
+        end = time.perf_counter()
         duration = end - start
-        
-        return {
-            "status": "success",
-            "message": f"Code generated and deployed successfully to new repository: {repo_url}",
-            "commit_url": final_url, # Return the deployment URL
-            "evaluation_url": payload.evaluation_url,
-            "time_taken":f"{duration:.2f} seconds"
-        }
-        
+
+        print(f"Code generated and deployed successfully to repository: {repo_url} "
+              f"(deployment: {final_url}) in {duration:.2f} seconds")
+
     except Exception as e:
+        # 4.6. Error (the client already received its 202, so only log here)
         print(f"Error during processing: {e}")
-        # 4.6. Error Response
+
+
+@app.post(
+    "/tasks",
+    summary="Receive a task submission",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=TaskAccepted,
+    # The body is parsed manually (after the secret header check), so document it here
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/json": {"schema": {"$ref": "#/components/schemas/TaskRequest"}}},
+            "required": True,
+        }
+    },
+)
+async def receive_task(
+    request: Request,
+    background_tasks: BackgroundTasks,
+):
+    """Receive the task submission JSON described in the project brief.
+
+    Validates the secret, queues the generation pipeline in the background and
+    immediately returns a 202 acknowledgement including the nonce.
+
+    The secret may be sent in the `X-TDS-Secret` header, which is checked before
+    the body is parsed so invalid traffic is rejected cheaply. Without the header,
+    the `secret` field of the JSON body is required and checked instead.
+    """
+    # Secret verification against the secrets loaded at startup.
+    allowed_secrets = request.app.state.allowed_secrets
+
+    if not allowed_secrets:
+        # If no secret configured, reject to avoid accidental acceptance in production.
+        raise HTTPException(status_code=401, detail="No server-side secret configured")
+
+    header_secret = request.headers.get("X-TDS-Secret")
+    if header_secret is not None and not _secret_is_allowed(header_secret, allowed_secrets):
+        raise HTTPException(status_code=401, detail="Invalid secret")
+
+    try:
+        payload = TaskRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        # Same 422 shape FastAPI produces for a declared body parameter
+        raise RequestValidationError(
+            [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+        ) from e
+
+    if header_secret is None:
+        if payload.secret is None:
+            raise HTTPException(status_code=401, detail="Missing secret")
+        if not _secret_is_allowed(payload.secret, allowed_secrets):
+            raise HTTPException(status_code=401, detail="Invalid secret")
+
+    # Resolve the clients only after authentication, so unauthenticated callers
+    # always get a 401 and never see the server's initialization state
+    llm_generator = require_llm()
+    github_manager = require_github()
+
+    retry_after = github_manager.rate_limit_retry_after()
+    if retry_after:
+        # Shed load until the GitHub rate limit window resets
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to process request: {e}"
+            status_code=503,
+            detail="GitHub rate limit nearly exhausted, retry later",
+            headers={"Retry-After": str(retry_after)},
         )
-    
+
+    background_tasks.add_task(
+        process_task,
+        payload,
+        request.app.state.http_client,
+        llm_generator,
+        github_manager,
+        request.app.state.github_semaphore,
+    )
+
+    return TaskAccepted(status="accepted", nonce=payload.nonce)
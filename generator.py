@@ -5,7 +5,10 @@ from dotenv import load_dotenv
 
 import json
 import base64 
+import hashlib
 import logging
+import threading
+import time
 from typing import Dict, Any, Optional,List, Union, Iterable
 from pydantic import BaseModel, Field, ValidationError
 
@@ -15,6 +18,11 @@ load_dotenv()  # Load environment variables from .env file
 
 AI_PIPE_TOKEN = os.getenv("AI_PIPE_TOKEN")
 
+# Generated files are cached per prompt so retries/reruns of a task skip the LLM call
+LLM_CACHE_TTL_SECONDS = 24 * 60 * 60
+LLM_CACHE_MAX_ENTRIES = 128
+LLM_CACHE_KEY_FIELDS = ("task", "round", "brief", "checks", "attachments")
+
 class GeneratedFiles(BaseModel):
     """Schema for the files generated by the LLM.
     This class definition GeneratedFiles is a Pydantic model that defines
@@ -35,7 +43,34 @@ class GenerateCodeLLM:
         
         self.model = model
         self.token = AI_PIPE_TOKEN
+        # cache key -> (expiry timestamp, generated files)
+        self._cache: Dict[str, tuple[float, Dict[str, str]]] = {}
+        self._cache_lock = threading.Lock()
         
+    def _cache_key(self, task_request: dict) -> str:
+        """Builds a deterministic SHA-256 key from the prompt-relevant task fields."""
+        key_data = {field: task_request.get(field) for field in LLM_CACHE_KEY_FIELDS}
+        key_data["model"] = self.model
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[Dict[str, str]]:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, files = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            return dict(files)
+
+    def _cache_set(self, key: str, files: Dict[str, str]) -> None:
+        with self._cache_lock:
+            self._cache.pop(key, None)
+            if len(self._cache) >= LLM_CACHE_MAX_ENTRIES:
+                # Dicts keep insertion order, so the first key is the oldest entry
+                del self._cache[next(iter(self._cache))]
+            self._cache[key] = (time.monotonic() + LLM_CACHE_TTL_SECONDS, dict(files))
         
     def _process_attachments(self, attachments: List[Dict[str, Any]]) -> str:
         """Decodes base64 attachments and formats them for the LLM prompt."""
@@ -68,6 +103,12 @@ class GenerateCodeLLM:
     def generate_app_files(self, task_request: dict) -> Dict[str, str]:
         """Generates code files based on the task and returns them as a dictionary."""
         
+        cache_key = self._cache_key(task_request)
+        cached_files = self._cache_get(cache_key)
+        if cached_files is not None:
+            print(f"Using cached LLM response for task: {task_request.get('task')}")
+            return cached_files
+
         # 1. Prepare Data and Prompts
         attachments_context = self._process_attachments(task_request.get("attachments", []))
         brief = task_request.get("brief", "No detailed brief provided.")
@@ -85,6 +126,8 @@ class GenerateCodeLLM:
         )
 
         generated_files = self._call_llm(user_prompt_text, model=self.model)
+        if generated_files:
+            self._cache_set(cache_key, generated_files)
         return generated_files
 
     def _call_llm(self,prompt: str, model: Optional[str] = "openai/gpt-4.1-nano") -> str:
@@ -122,6 +165,7 @@ class GenerateCodeLLM:
         
         payload = {
             "model": model,
+            "temperature": 0, # deterministic output, so cached responses match a fresh call
             "messages": [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": prompt},
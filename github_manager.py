@@ -1,11 +1,54 @@
 # github_manager.py
 import os
-import requests
+import base64
+import hashlib
+import asyncio
+import functools
+import threading
+import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from github import Github, GithubException, InputGitAuthor#, PagesSourceHash # Add PagesSourceHash
+from github import Github, GithubException, InputGitAuthor, InputGitTreeElement#, PagesSourceHash # Add PagesSourceHash
 from github.GithubObject import NotSet # Import NotSet for configuration
 load_dotenv()
 
+# Number of blobs uploaded concurrently when building a commit
+BLOB_UPLOAD_WORKERS = 8
+
+# Retries of the main ref lookup while a new repository still reports itself as empty
+REF_LOOKUP_ATTEMPTS = 5
+REF_LOOKUP_DELAY_SECONDS = 1
+
+# Number of synchronous PyGithub pipelines that may run at the same time
+GITHUB_EXECUTOR_WORKERS = 16
+
+# New tasks are refused while fewer core API requests than this remain in the window
+GITHUB_RATE_LIMIT_RESERVE = 100
+
+# Maximum number of uploaded (repo, blob SHA) pairs remembered across tasks
+BLOB_CACHE_MAX_ENTRIES = 1024
+
+# Blobs no commit references may be garbage-collected by GitHub, so forget uploads after this
+BLOB_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+
+def git_blob_sha(data: bytes) -> str:
+    """Returns the SHA-1 Git assigns to a blob with the given content."""
+    h = hashlib.sha1()
+    h.update(f"blob {len(data)}\0".encode())
+    h.update(data)
+    return h.hexdigest()
+
+
+def _as_bytes(content) -> bytes:
+    """Returns file content as bytes, encoding str content as UTF-8 only once."""
+    return content if isinstance(content, (bytes, bytearray)) else content.encode("utf-8")
+
+
+def _repo_name(task_id: str) -> str:
+    return f"llm-app-{task_id.lower()}"
+
 class GitHubManager:
     """Handles all interactions with the GitHub API for repo creation and deployment."""
     """
@@ -24,13 +67,65 @@ class GitHubManager:
             raise ValueError("GitHub credentials (GITHUB_TOKEN or GITHUB_USERNAME) are not set in .env.")
             
         self.g = Github(self.token)
+        # PyGithub is blocking, so its calls run here instead of on the event loop
+        self._executor = ThreadPoolExecutor(max_workers=GITHUB_EXECUTOR_WORKERS)
+        # Last known core rate limit state (from X-RateLimit-* response headers)
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None # epoch seconds
+        # (repo id, blob SHA) -> upload time, for blobs already uploaded. GitHub's blob
+        # SHA is the Git blob SHA computed locally, so only the upload time is stored.
+        self._blob_cache: dict[tuple[int, str], float] = {}
+        self._blob_cache_lock = threading.Lock()
         
-    def create_and_deploy(self, task_id: str, files: dict) -> tuple[str, str, str]:
+    def _blob_cached(self, key) -> bool:
+        with self._blob_cache_lock:
+            uploaded_at = self._blob_cache.get(key)
+            if uploaded_at is None:
+                return False
+            if time.monotonic() - uploaded_at >= BLOB_CACHE_TTL_SECONDS:
+                del self._blob_cache[key]
+                return False
+            return True
+
+    def _cache_blob(self, key) -> None:
+        with self._blob_cache_lock:
+            self._blob_cache.pop(key, None)
+            if len(self._blob_cache) >= BLOB_CACHE_MAX_ENTRIES:
+                # Dicts keep insertion order, so the first key is the oldest entry
+                del self._blob_cache[next(iter(self._blob_cache))]
+            self._blob_cache[key] = time.monotonic()
+
+    def _evict_blob(self, key) -> None:
+        with self._blob_cache_lock:
+            self._blob_cache.pop(key, None)
+
+    def _record_rate_limit(self, remaining, reset):
+        if remaining is not None and reset is not None:
+            self.rate_limit_remaining = int(remaining)
+            self.rate_limit_reset = int(reset)
+
+    def rate_limit_retry_after(self) -> int:
+        """Seconds until the rate limit window resets if too few requests remain, else 0."""
+        if self.rate_limit_remaining is None or self.rate_limit_remaining >= GITHUB_RATE_LIMIT_RESERVE:
+            return 0
+        return max(0, self.rate_limit_reset - int(time.time()))
+
+    async def ensure_repo(self, task_id: str):
+        """Creates the public repository for `task_id`, or retrieves it if it exists.
+
+        Runs on the manager's thread pool so it can overlap with other work
+        (e.g. LLM generation); the result can be passed to `create_and_deploy`.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._ensure_repo, task_id))
+
+    async def create_and_deploy(self, task_id: str, files: dict, http_client: httpx.AsyncClient, repo=None) -> tuple[str, str, str]:
         """
         Creates a public repository, commits files, and enables GitHub Pages.
         This code snippet defines a method create_and_deploy in a class GitHubManager.
-        The method takes in a task_id (a string) and a files dictionary as parameters
-        and returns a tuple of three strings namely as follows:
+        The method takes in a task_id (a string), a files dictionary and the shared
+        httpx.AsyncClient (used for the Pages REST call) as parameters, plus an
+        optional repository already obtained from `ensure_repo`, and returns a tuple of three strings namely as follows:
         the URL of the created repository,
         the SHA of the final commit, and
         the URL of the GitHub Pages site.
@@ -40,16 +135,19 @@ class GitHubManager:
         It creates a repository name by concatenating the string "llm-app-"
         with the lowercase task_id.
         
-        It checks if a repository with the same name already exists.
-        If it does, it retrieves the existing repository.
+        Unless a repository was passed in, it checks if a repository with the
+        same name already exists. If it does, it retrieves the existing repository.
         If not, it creates a new repository with the given name, description,
         and public visibility.
         
-        It checks if the main branch exists in the repository.
-        If it doesn't, it retrieves the default branch (often 'master').
+        It looks up the main branch to use as the parent commit. New repositories
+        are auto-initialized so that the Git Data API can be used on them; if
+        main does not exist yet, it is created from a root commit.
         
-        It iterates over the files dictionary and commits each file to the repository.
-        If a file already exists, it updates the file. If not, it creates a new file.
+        It uploads one blob per changed file concurrently (files whose Git blob
+        SHA already matches main are skipped), builds a single tree on top of
+        the parent tree and creates a single commit for all files, then moves
+        the main branch to that commit. If nothing changed, no commit is made.
         
         It enables GitHub Pages by setting the default branch to 'main' and fetching
         the Pages status. If the Pages object cannot be fetched, it relies on the
@@ -61,8 +159,60 @@ class GitHubManager:
         The code includes some error handling, such as catching GithubException and
         Exception to handle various scenarios and raise appropriate errors.
         """
-        repo_name = f"llm-app-{task_id.lower()}"
+        repo_name = _repo_name(task_id)
+        
+        # 1. Create Repository (or retrieve existing one) unless the caller already did
+        if repo is None:
+            repo = await self.ensure_repo(task_id)
+
+        # 2. Commit files off the event loop
+        loop = asyncio.get_running_loop()
+        commit_sha = await loop.run_in_executor(
+            self._executor,
+            functools.partial(self._commit_files, repo, task_id, files)
+        )
         
+        # 3. Enable GitHub Pages via REST API
+        try:
+            api_url = f"https://api.github.com/repos/{self.username}/{repo_name}/pages"
+            headers = {
+                "Accept": "application/vnd.github.v3+json",
+                "Authorization": f"token {self.token}"
+            }
+            payload = {
+                "source": {
+                    "branch": "main",
+                    "path": "/"
+                }
+            }
+            response = await http_client.post(api_url, headers=headers, json=payload)
+            self._record_rate_limit(
+                response.headers.get("X-RateLimit-Remaining"),
+                response.headers.get("X-RateLimit-Reset")
+            )
+            
+            if response.status_code in [201, 204]:
+                print("✅ GitHub Pages successfully enabled on main branch.")
+            elif response.status_code == 409:
+                # Pages already enabled
+                print("ℹ️ GitHub Pages already enabled.")
+            else:
+                print(f"⚠️ GitHub Pages setup failed: {response.status_code} - {response.text}")
+
+            # Construct Pages URL
+            pages_url = f"https://{self.username}.github.io/{repo_name}/"
+            print(f"Click to view the deployed app: {pages_url}")
+        except Exception as e:
+            print(f"Warning: Failed to enable GitHub Pages automatically. Error: {e}")
+            pages_url = f"https://{self.username}.github.io/{repo_name}/"
+
+        # 4. Return Details
+        return repo.html_url, commit_sha, pages_url
+
+    def _ensure_repo(self, task_id: str):
+        """Synchronous create-or-get of the task repository; runs on the thread pool."""
+        repo_name = _repo_name(task_id)
+
         # --- ORIGINAL LINE (Cause of error): ---
         # user = self.g.get_user(self.username)
         
@@ -75,7 +225,8 @@ class GitHubManager:
             repo = user.create_repo( # Now calling create_repo on the authenticated user
                 repo_name, 
                 description=f"LLM generated code for task {task_id}", 
-                private=False 
+                private=False,
+                auto_init=True # Git Data API calls fail on empty repositories
             )
             print(f"Created repository: {repo_name}...")
         except GithubException as e:
@@ -84,86 +235,118 @@ class GitHubManager:
                 print(f"Repository already exists: {repo_name}. Updating files...")
             else:
                 raise e
-        
-        # Ensure main branch exists (and create if it doesn't, though PyGithub usually handles this)
-        try:
-            main_ref = repo.get_git_ref("heads/main")
-        except GithubException:
-            # If main doesn't exist, get the default branch, which is often 'master' on old setups.
-            # We assume it's created upon the first commit.
-            pass
+
+        return repo
+
+    def _commit_files(self, repo, task_id: str, files: dict) -> str:
+        """Commits all files to main as a single commit and returns its SHA.
+
+        Runs synchronously on the manager's thread pool.
+        """
+        # Use main as the parent commit if it exists; otherwise main is created below.
+        # A just-created repo can briefly report 409 "Git Repository is empty" while
+        # its auto-init commit lands, so that case is retried.
+        main_ref = None
+        parent_commit = None
+        for attempt in range(1, REF_LOOKUP_ATTEMPTS + 1):
+            try:
+                main_ref = repo.get_git_ref("heads/main")
+                parent_commit = repo.get_git_commit(main_ref.object.sha)
+                break
+            except GithubException as e:
+                if e.status == 404:
+                    # No main branch yet: commit from a root commit and create it
+                    main_ref = None
+                    break
+                if e.status != 409:
+                    raise e
+                if attempt == REF_LOOKUP_ATTEMPTS:
+                    # The Git Data API cannot write to an empty repository either
+                    raise GithubException(
+                        e.status,
+                        {"message": f"Repository {repo.full_name} is still empty after "
+                                    f"{REF_LOOKUP_ATTEMPTS} attempts; cannot commit files."},
+                        e.headers
+                    ) from e
+                time.sleep(REF_LOOKUP_DELAY_SECONDS)
+
+        # SHAs of the files already on main, used to skip unchanged content
+        existing_shas = {}
+        if parent_commit is not None:
+            parent_tree = repo.get_git_tree(parent_commit.tree.sha, recursive=True)
+            existing_shas = {
+                element.path: element.sha
+                for element in parent_tree.tree
+                if element.type == "blob"
+            }
             
-        # 2. Commit Files
-        commit_sha = ""
+        # 2. Commit Files (one blob per file, then a single tree and commit)
+        contents = {}
         for filename, content in files.items():
             if not content.strip():
                 print(f"Skipping empty file: {filename}")
                 continue
             
-            content_bytes = content.encode('utf-8')
+            content_bytes = _as_bytes(content)
+            local_sha = git_blob_sha(content_bytes)
+            if existing_shas.get(filename) == local_sha:
+                print(f"Skipping unchanged file: {filename}")
+                continue
+
+            contents[filename] = (content_bytes, local_sha)
+
+        def create_blob(item, use_cache=True):
+            filename, (content_bytes, local_sha) = item
+            cache_key = (repo.id, local_sha)
+            if use_cache and self._blob_cached(cache_key):
+                # Uploaded to this repository earlier but not on main (e.g. a failed commit)
+                return filename, local_sha, True
+
+            repo.create_git_blob(base64.b64encode(content_bytes).decode("ascii"), "base64")
+            self._cache_blob(cache_key)
+            return filename, local_sha, False
 
+        # PyGithub is synchronous, so upload the blobs from a thread pool
+        with ThreadPoolExecutor(max_workers=BLOB_UPLOAD_WORKERS) as pool:
+            results = list(pool.map(create_blob, contents.items()))
+        blob_shas = {filename: sha for filename, sha, _ in results}
+        cached_files = [filename for filename, _, from_cache in results if from_cache]
+
+        if not blob_shas:
+            commit_sha = parent_commit.sha if parent_commit else ""
+        else:
+            tree_elements = [
+                InputGitTreeElement(path=filename, mode="100644", type="blob", sha=sha)
+                for filename, sha in blob_shas.items()
+            ]
+            base_tree = parent_commit.tree if parent_commit is not None else NotSet
             try:
-                # Check if file exists to decide between create_file and update_file
-                repo.get_contents(filename, ref="main")
-                
-                # Update file
-                file_obj = repo.update_file(
-                    path=filename,
-                    message=f"Update {filename} for task {task_id}",
-                    content=content_bytes,
-                    sha=repo.get_contents(filename).sha,
-                    branch="main"
-                )
-                print(f"Updated {filename}. SHA: {file_obj['commit'].sha[:7]}")
+                tree = repo.create_git_tree(tree_elements, base_tree=base_tree)
             except GithubException as e:
-                # File does not exist, create it
-                if e.status == 404:
-                    file_obj = repo.create_file(
-                        path=filename,
-                        message=f"Initial commit of {filename} for task {task_id}",
-                        content=content_bytes,
-                        branch="main"
-                    )
-                    print(f"Committed {filename}. SHA: {file_obj['commit'].sha[:7]}")
-                else:
+                if e.status != 422 or not cached_files:
                     raise e
-            
-            commit_sha = file_obj['commit'].sha # Get the SHA of the final commit
-            
-        import requests
+                # A cached blob may have been garbage-collected; upload those again and retry once
+                print(f"Tree creation failed, re-uploading cached blobs: {cached_files}")
+                for filename in cached_files:
+                    self._evict_blob((repo.id, blob_shas[filename]))
+                    create_blob((filename, contents[filename]), use_cache=False)
+                tree = repo.create_git_tree(tree_elements, base_tree=base_tree)
 
-        # 3. Enable GitHub Pages via REST API
-        try:
-            api_url = f"https://api.github.com/repos/{self.username}/{repo_name}/pages"
-            headers = {
-                "Accept": "application/vnd.github.v3+json",
-                "Authorization": f"token {self.token}"
-            }
-            payload = {
-                "source": {
-                    "branch": "main",
-                    "path": "/"
-                }
-            }
-            response = requests.post(api_url, headers=headers, json=payload)
-            
-            if response.status_code in [201, 204]:
-                print("✅ GitHub Pages successfully enabled on main branch.")
-            elif response.status_code == 409:
-                # Pages already enabled
-                print("ℹ️ GitHub Pages already enabled.")
+            message = f"Commit {', '.join(blob_shas)} for task {task_id}"
+            if parent_commit is not None:
+                commit = repo.create_git_commit(message, tree, [parent_commit])
+                main_ref.edit(commit.sha)
             else:
-                print(f"⚠️ GitHub Pages setup failed: {response.status_code} - {response.text}")
+                commit = repo.create_git_commit(message, tree, [])
+                repo.create_git_ref("refs/heads/main", commit.sha)
+            commit_sha = commit.sha
+            print(f"Committed {len(blob_shas)} files. SHA: {commit_sha[:7]}")
 
-            # Construct Pages URL
-            pages_url = f"https://{self.username}.github.io/{repo_name}/"
-            print(f"Click to view the deployed app: {pages_url}")
-        except Exception as e:
-            print(f"Warning: Failed to enable GitHub Pages automatically. Error: {e}")
-            pages_url = f"https://{self.username}.github.io/{repo_name}/"
+        # PyGithub keeps the rate limit headers of its last response
+        remaining, _ = self.g.rate_limiting
+        self._record_rate_limit(remaining, self.g.rate_limiting_resettime)
 
-        # 4. Return Details
-        return repo.html_url, commit_sha, pages_url
+        return commit_sha
 
 # --- Independent Test Block ---
 if __name__ == "__main__":
@@ -178,11 +361,16 @@ if __name__ == "__main__":
             "LICENSE": "MIT License content here."
         }
         
+        async def run_test():
+            async with httpx.AsyncClient(timeout=60.0) as http_client:
+                return await manager.create_and_deploy(
+                    task_id=TEST_TASK_ID, 
+                    files=test_files,
+                    http_client=http_client
+                )
+
         manager = GitHubManager()
-        repo_url, commit_sha, pages_url = manager.create_and_deploy(
-            task_id=TEST_TASK_ID, 
-            files=test_files
-        )
+        repo_url, commit_sha, pages_url = asyncio.run(run_test())
         
         print("\n--- TEST SUCCESSFUL ---")
         print(f"Repo URL: {repo_url}")